@@ -1,18 +1,26 @@
 """
 timeout_cafes_snapshot_v3.py
 Fixed TimeOut London cafes scraper with improved parsing logic.
-Requires: requests, beautifulsoup4, pandas, openpyxl
-Install: pip install requests beautifulsoup4 pandas openpyxl
+Requires: requests, lxml, pyarrow, openpyxl
+Install: pip install requests lxml pyarrow openpyxl
 """
 
-import os, re, time, random, requests, logging
-from urllib.parse import urljoin
-from bs4 import BeautifulSoup
-import pandas as pd
+import os, re, csv, time, threading, requests, logging
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import lxml.etree
+import lxml.html
+import pyarrow as pa
+import pyarrow.parquet as pq
+import openpyxl
 
 # -------- config --------
 URL = "https://www.timeout.com/london/food-drink/londons-best-cafes-and-coffee-shops"
 MAX_ITEMS = 20
+MAX_WORKERS = 10
+REQUESTS_PER_SECOND = 5  # global politeness cap on venue-page fetches
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
     "Accept-Language": "en-GB,en;q=0.9"
@@ -21,53 +29,132 @@ SAVE_DIR = os.path.join(os.path.expanduser("~"), "Desktop", "ws portfolio")
 os.makedirs(SAVE_DIR, exist_ok=True)
 SAVE_CSV = os.path.join(SAVE_DIR, "timeout_london_cafes.csv")
 SAVE_XLSX = os.path.join(SAVE_DIR, "timeout_london_cafes.xlsx")
+SAVE_PARQUET = os.path.join(SAVE_DIR, "timeout_london_cafes.parquet")
 LOG_FILE = os.path.join(SAVE_DIR, "timeout_errors.log")
+WRITE_BUFFER = 1 << 20  # bytes buffered per output file before hitting the OS
+COLUMNS = ["name", "description", "address", "phone", "website", "opening_hours", "source_link"]
 
 # logging
 logging.basicConfig(filename=LOG_FILE, level=logging.INFO,
                     format='%(asctime)s %(levelname)s %(message)s')
 
+# shared session so every request to timeout.com reuses pooled keep-alive connections;
+# transient failures are retried with exponential backoff (honouring Retry-After)
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_retry = Retry(total=3, backoff_factor=1.4, status_forcelist=(429, 500, 502, 503, 504),
+               allowed_methods=frozenset(["GET"]))
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=_retry)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
 # --------- helpers ----------
-def fetch(url, retries=3, backoff=1.4, timeout=20):
-    """Fetch URL with retry logic"""
-    last_exc = None
-    for attempt in range(1, retries+1):
-        try:
-            r = requests.get(url, headers=HEADERS, timeout=timeout)
-            r.raise_for_status()
-            return r.text
-        except Exception as e:
-            last_exc = e
-            wait = backoff ** attempt + random.random()
-            logging.info(f"Fetch failed ({attempt}) {url} -> {e}; waiting {wait:.1f}s")
-            time.sleep(wait)
-    raise last_exc
+def fetch(url, timeout=20):
+    """Fetch URL (retries are handled by the session adapter)"""
+    r = SESSION.get(url, timeout=timeout)
+    r.raise_for_status()
+    return r.text
+
+# lxml parsers must not be shared between threads, so keep one per worker
+_parser_local = threading.local()
+
+def parse_html(html):
+    """Parse HTML with lxml, dropping comments and blank text and skipping the id index"""
+    parser = getattr(_parser_local, "parser", None)
+    if parser is None:
+        parser = lxml.html.HTMLParser(remove_comments=True, remove_blank_text=True,
+                                      collect_ids=False)
+        _parser_local.parser = parser
+    root = lxml.html.fromstring(html, parser=parser)
+    # Script/style bodies are never page text; blank them once so text walks skip them
+    for elem in root.iter('script', 'style'):
+        elem.text = None
+    return root
+
+def node_text(node, sep=" "):
+    """Stripped text runs of an lxml node joined by sep"""
+    parts = (t.strip() for t in node.itertext())
+    return sep.join(p for p in parts if p)
+
+def first_link(elem):
+    """First <a> inside elem, otherwise the next one after it in the document"""
+    links = elem.xpath('(.//a | following::a)[1]')
+    return links[0] if links else None
+
+# Article text patterns
+ENTRY_SPLIT_RE = re.compile(r'(?=What is it\?)')
+NUM_PREFIX_RE = re.compile(r'^\d+\.\s*')
+WHAT_RE = re.compile(r'What is it\?\s*(.+?)(?=Why we love it:|Order this:|Address:|$)',
+                     re.DOTALL | re.IGNORECASE)
+WHY_RE = re.compile(r'Why we love it:\s*(.+?)(?=Order this:|Address:|$)',
+                    re.DOTALL | re.IGNORECASE)
+ADDR_RE = re.compile(r'Address:\s*(.+?)(?=Opening hours?:|$)', re.DOTALL | re.IGNORECASE)
+HOURS_RE = re.compile(r'Opening hours?:\s*(.+?)(?=\n\n|$)', re.DOTALL | re.IGNORECASE)
+NOISE_RE = re.compile(r'recommended|stars|shopping|out of', re.IGNORECASE)
+
+# Heading-fallback patterns (text there is joined with spaces, not newlines)
+HEADING_TAG_RE = re.compile(r'^h[1-6]$')
+GENERIC_HEADING_RE = re.compile(r'best café|top|london|time out', re.IGNORECASE)
+HEADING_WHAT_RE = re.compile(r'What is it\?\s*(.+?)(?=Why we love it:|Address:|$)', re.IGNORECASE)
+HEADING_ADDR_RE = re.compile(r'Address:\s*(.+?)(?=Opening|$)', re.IGNORECASE)
+HEADING_HOURS_RE = re.compile(r'Opening hours?:\s*(.+?)(?:\.|$)', re.IGNORECASE)
+
+_url_parts = urlsplit(URL)
+URL_ORIGIN = f"{_url_parts.scheme}://{_url_parts.netloc}"
+
+def absolute_url(href):
+    """Resolve an article href against URL, skipping urljoin for the common cases"""
+    if href.startswith('/') and not href.startswith('//'):
+        return URL_ORIGIN + href
+    if href.startswith(('http://', 'https://')):
+        return href
+    return urljoin(URL, href)
+
+def link_for_elem(elem, name_key):
+    """Resolve the venue link for a heading or anchor matching a cafe name"""
+    if elem.tag == 'a' and elem.get('href'):
+        return absolute_url(elem.get('href'))
+    # Check for nearby link
+    link = first_link(elem)
+    if link is not None and link.get('href'):
+        href = link.get('href')
+        # Make sure it's a venue link, not navigation
+        if '/venue/' in href or name_key.replace(' ', '-') in href.lower():
+            return absolute_url(href)
+    return ""
 
 def extract_article_entries(html):
     """Extract cafe entries from TimeOut article using text pattern matching"""
-    soup = BeautifulSoup(html, "html.parser")
     entries = []
+    try:
+        root = parse_html(html)
+    except (lxml.etree.ParserError, ValueError) as e:
+        # Empty documents and str input carrying an XML encoding declaration
+        logging.error("Could not find main content area (%s)", e)
+        return entries
     
     # Get all text content from the page
     # Look for the main article/content area
-    main_content = soup.find('main') or soup.find('article') or soup.find('body')
+    candidates = root.xpath('//main') or root.xpath('//article') or root.xpath('//body')
     
-    if not main_content:
+    if not candidates:
         logging.error("Could not find main content area")
         return entries
+    main_content = candidates[0]
     
-    # Get all text blocks
-    text_blocks = []
-    for elem in main_content.find_all(['p', 'div', 'section', 'li']):
-        text = elem.get_text("\n", strip=True)
-        if text and len(text) > 20:
-            text_blocks.append(text)
-    
-    # Combine into one text and split by cafe entries
-    full_text = "\n".join(text_blocks)
+    # Get the article text in one pass (nested blocks are no longer repeated)
+    full_text = node_text(main_content, "\n")
     
     # Split by "What is it?" pattern - this marks the start of each cafe
-    entries_raw = re.split(r'(?=What is it\?)', full_text)
+    entries_raw = ENTRY_SPLIT_RE.split(full_text)
+    
+    # Index headings/links once instead of re-walking the DOM for every entry
+    name_index = []
+    by_exact = {}
+    for elem in main_content.iter('h2', 'h3', 'h4', 'a'):
+        elem_text = node_text(elem, "").lower()
+        name_index.append((elem_text, elem))
+        by_exact.setdefault(elem_text, elem)
     
     for entry_text in entries_raw:
         if 'What is it?' not in entry_text:
@@ -89,27 +176,24 @@ def extract_article_entries(html):
             # Look for a line that looks like a cafe name
             if line and len(line) < 100 and 'What is it?' not in line:
                 # Filter out noise
-                if not any(x in line.lower() for x in ['recommended', 'stars', 'shopping', 'out of']):
+                if not NOISE_RE.search(line):
                     if len(line.split()) >= 2:  # At least 2 words
-                        entry['name'] = re.sub(r'^\d+\.\s*', '', line).strip()
+                        entry['name'] = NUM_PREFIX_RE.sub('', line).strip()
                         break
         
         # Extract description from "What is it?" section
-        what_match = re.search(r'What is it\?\s*(.+?)(?=Why we love it:|Order this:|Address:|$)', 
-                               entry_text, re.DOTALL | re.IGNORECASE)
+        what_match = WHAT_RE.search(entry_text)
         if what_match:
             entry['description'] = what_match.group(1).strip()
         
         # If no "What is it?" description, try "Why we love it:"
         if not entry['description']:
-            why_match = re.search(r'Why we love it:\s*(.+?)(?=Order this:|Address:|$)', 
-                                  entry_text, re.DOTALL | re.IGNORECASE)
+            why_match = WHY_RE.search(entry_text)
             if why_match:
                 entry['description'] = why_match.group(1).strip()
         
         # Extract address
-        addr_match = re.search(r'Address:\s*(.+?)(?=Opening hours?:|$)', 
-                              entry_text, re.DOTALL | re.IGNORECASE)
+        addr_match = ADDR_RE.search(entry_text)
         if addr_match:
             addr = addr_match.group(1).strip()
             # Clean up - take only first line or up to postcode
@@ -117,32 +201,24 @@ def extract_article_entries(html):
             entry['address'] = addr_lines[0].strip()
         
         # Extract opening hours
-        hours_match = re.search(r'Opening hours?:\s*(.+?)(?=\n\n|$)', 
-                               entry_text, re.DOTALL | re.IGNORECASE)
+        hours_match = HOURS_RE.search(entry_text)
         if hours_match:
             entry['opening_hours'] = hours_match.group(1).strip().replace('\n', ' ')
         
         # Only add if we have at least a name and description
         if entry['name'] and entry['description']:
-            # Find corresponding link in HTML
-            # Search for the cafe name in the soup to find its link
-            if entry['name']:
-                # Look for heading or link with this name
-                for elem in main_content.find_all(['h2', 'h3', 'h4', 'a']):
-                    elem_text = elem.get_text(strip=True)
-                    if entry['name'].lower() in elem_text.lower() or elem_text.lower() in entry['name'].lower():
-                        if elem.name == 'a' and elem.get('href'):
-                            entry['source_link'] = urljoin(URL, elem.get('href'))
+            # Find corresponding link in HTML: exact heading/link text first,
+            # then fall back to a substring match over the prebuilt index
+            name_key = entry['name'].lower()
+            exact = by_exact.get(name_key)
+            if exact is not None:
+                entry['source_link'] = link_for_elem(exact, name_key)
+            if not entry['source_link']:
+                for elem_text, elem in name_index:
+                    if name_key in elem_text or elem_text in name_key:
+                        entry['source_link'] = link_for_elem(elem, name_key)
+                        if entry['source_link']:
                             break
-                        else:
-                            # Check for nearby link
-                            link = elem.find('a') or elem.find_next('a')
-                            if link and link.get('href'):
-                                href = link.get('href')
-                                # Make sure it's a venue link, not navigation
-                                if '/venue/' in href or entry['name'].lower().replace(' ', '-') in href.lower():
-                                    entry['source_link'] = urljoin(URL, href)
-                                    break
             
             entries.append(entry)
             
@@ -152,28 +228,38 @@ def extract_article_entries(html):
     # If we found no entries, try alternative method
     if not entries:
         logging.info("Pattern-based extraction failed, trying heading-based method")
-        entries = extract_by_headings(soup)
+        entries = extract_by_headings(main_content)
     
     return entries[:MAX_ITEMS]
 
-def extract_by_headings(soup):
+def sibling_texts(h):
+    """Yield the text runs that follow a heading, up to the next heading"""
+    yield (h.tail or "").strip()
+    for sib in h.itersiblings():
+        if isinstance(sib.tag, str):
+            if HEADING_TAG_RE.match(sib.tag):
+                return
+            yield node_text(sib)
+        yield (sib.tail or "").strip()
+
+def extract_by_headings(root):
     """Alternative extraction method using headings"""
     entries = []
     seen = set()
     
     # Find all headings
-    headings = soup.find_all(['h2', 'h3', 'h4'])
+    headings = root.iter('h2', 'h3', 'h4')
     
     for h in headings:
-        name = h.get_text(" ", strip=True)
+        name = node_text(h)
         if not name or len(name) > 100:
             continue
         
         # Skip generic headings
-        if any(x in name.lower() for x in ['best café', 'top', 'london', 'time out']):
+        if GENERIC_HEADING_RE.search(name):
             continue
         
-        name = re.sub(r'^\d+\.\s*', '', name).strip()
+        name = NUM_PREFIX_RE.sub('', name).strip()
         key = name.lower()
         
         if key in seen or len(name.split()) < 2:
@@ -186,25 +272,20 @@ def extract_by_headings(soup):
         address = ""
         opening_hours = ""
         
-        # Get next siblings
-        current = h.next_sibling
+        # Get next siblings (up to the next heading)
         collected_text = []
         
-        while current and len(collected_text) < 10:
-            if hasattr(current, 'name'):
-                if current.name and re.match(r'^h[1-6]$', current.name):
-                    break
-                text = current.get_text(" ", strip=True)
-                if text:
-                    collected_text.append(text)
-            current = current.next_sibling if hasattr(current, 'next_sibling') else None
+        for text in sibling_texts(h):
+            if len(collected_text) >= 10:
+                break
+            if text:
+                collected_text.append(text)
         
         full_text = " ".join(collected_text)
         
         # Parse collected text
         if 'What is it?' in full_text:
-            desc_match = re.search(r'What is it\?\s*(.+?)(?=Why we love it:|Address:|$)', 
-                                   full_text, re.IGNORECASE)
+            desc_match = HEADING_WHAT_RE.search(full_text)
             if desc_match:
                 description = desc_match.group(1).strip()
         
@@ -213,23 +294,23 @@ def extract_by_headings(soup):
         
         # Address
         if 'Address:' in full_text:
-            addr_match = re.search(r'Address:\s*(.+?)(?=Opening|$)', full_text, re.IGNORECASE)
+            addr_match = HEADING_ADDR_RE.search(full_text)
             if addr_match:
                 address = addr_match.group(1).strip()
         
         # Opening hours
         if 'Opening hours' in full_text or 'Opening Hours' in full_text:
-            hours_match = re.search(r'Opening hours?:\s*(.+?)(?:\.|$)', full_text, re.IGNORECASE)
+            hours_match = HEADING_HOURS_RE.search(full_text)
             if hours_match:
                 opening_hours = hours_match.group(1).strip()
         
         # Find link
-        link = h.find('a') or h.find_next('a')
+        link = first_link(h)
         source_link = ""
-        if link and link.get('href'):
+        if link is not None and link.get('href'):
             href = link.get('href')
             if '/venue/' in href or not href.startswith('http'):
-                source_link = urljoin(URL, href)
+                source_link = absolute_url(href)
         
         if description:  # Only add if we have a description
             entries.append({
@@ -249,6 +330,13 @@ def extract_by_headings(soup):
 PHONE_RE = re.compile(r'(\+44\s?\d[\d\s\-]{7,}\d|0\d{2,4}[\s\-]?\d{3,4}[\s\-]?\d{3,4})')
 POSTCODE_RE = re.compile(r'[A-Z]{1,2}\d{1,2}[A-Z]?\s*\d[A-Z]{2}', re.IGNORECASE)
 
+# First link of each kind, in priority order (rel*=nofollow, target=_blank, .external)
+WEBSITE_XPATHS = (
+    '(//a[contains(@rel, "nofollow")])[1]/@href',
+    '(//a[@target="_blank"])[1]/@href',
+    '(//a[contains(concat(" ", normalize-space(@class), " "), " external ")])[1]/@href',
+)
+
 def scrape_venue_info(url):
     """Scrape additional venue details from individual pages"""
     out = {"phone": "", "website": "", "address": ""}
@@ -257,29 +345,37 @@ def scrape_venue_info(url):
     
     try:
         html = fetch(url)
-        soup = BeautifulSoup(html, "html.parser")
+        root = parse_html(html)
+        
+        # Full-page text is only needed by the fallbacks; build it at most once
+        page_text = None
+        def full_text():
+            nonlocal page_text
+            if page_text is None:
+                page_text = node_text(root)
+            return page_text
 
         # Phone: look for tel: links
-        tel = soup.select_one('a[href^="tel:"]')
-        if tel and tel.get("href"):
-            out["phone"] = tel.get("href").replace("tel:", "").strip()
+        tel = root.xpath('(//a[starts-with(@href, "tel:")])[1]/@href')
+        if tel and tel[0]:
+            out["phone"] = tel[0].replace("tel:", "").strip()
         
         # Website: external links
-        for sel in ['a[rel*="nofollow"]', 'a[target="_blank"]', 'a.external']:
-            a = soup.select_one(sel)
-            if a and a.get("href"):
-                href = a.get("href")
+        for xp in WEBSITE_XPATHS:
+            hrefs = root.xpath(xp)
+            if hrefs and hrefs[0]:
+                href = hrefs[0]
                 if "timeout.com" not in href and href.startswith("http"):
                     out["website"] = href
                     break
         
         # Address: look for address tag
-        addr_tag = soup.find("address")
-        if addr_tag:
-            out["address"] = addr_tag.get_text(" ", strip=True)
+        addr_tags = root.xpath('//address')
+        if addr_tags:
+            out["address"] = node_text(addr_tags[0])
         else:
             # Search for postcode in text
-            text = soup.get_text(" ", strip=True)
+            text = full_text()
             match = POSTCODE_RE.search(text)
             if match:
                 idx = match.start()
@@ -287,16 +383,79 @@ def scrape_venue_info(url):
         
         # Phone fallback
         if not out["phone"]:
-            text = soup.get_text(" ", strip=True)
+            text = full_text()
             match = PHONE_RE.search(text)
             if match:
                 out["phone"] = match.group(0).strip()
     
     except Exception as e:
-        logging.info(f"scrape_venue_info failed for {url}: {e}")
+        logging.info("scrape_venue_info failed for %s: %s", url, e)
     
     return out
 
+_rate_lock = threading.Lock()
+_next_slot = 0.0
+
+def wait_for_slot():
+    """Block until the shared REQUESTS_PER_SECOND budget allows another request"""
+    global _next_slot
+    with _rate_lock:
+        now = time.monotonic()
+        slot = max(now, _next_slot)
+        _next_slot = slot + 1.0 / REQUESTS_PER_SECOND
+    time.sleep(slot - now)
+
+def enrich(e):
+    """Merge an article entry with details from its venue page into an output row"""
+
+    phone = ""
+    website = ""
+    address = e.get("address", "")
+
+    # Try to get more details from individual page
+    if e.get("source_link"):
+        try:
+            # Be polite: share one request rate across all workers
+            wait_for_slot()
+            venue = scrape_venue_info(e["source_link"])
+            phone = venue.get("phone", "")
+            website = venue.get("website", "")
+            if not address:
+                address = venue.get("address", "")
+        except Exception as ex:
+            logging.warning("Error scraping %s: %s", e.get('source_link'), ex)
+
+    return {
+        "name": e.get("name", ""),
+        "description": e.get("description", ""),
+        "address": address,
+        "phone": phone,
+        "website": website,
+        "opening_hours": e.get("opening_hours", ""),
+        "source_link": e.get("source_link", "")
+    }
+
+def write_csv(rows, path):
+    """Write row dicts straight to CSV"""
+    with open(path, 'w', newline='', encoding='utf-8', buffering=WRITE_BUFFER) as f:
+        w = csv.DictWriter(f, fieldnames=COLUMNS)
+        w.writeheader()
+        w.writerows(rows)
+
+def write_xlsx(rows, path):
+    """Write row dicts as plain values using openpyxl's streaming write-only mode"""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("cafes")
+    ws.append(COLUMNS)
+    for row in rows:
+        ws.append([row[c] for c in COLUMNS])
+    wb.save(path)
+
+def write_parquet(rows, path):
+    """Write row dicts as a zstd-compressed Parquet file"""
+    table = pa.table({c: [row[c] for row in rows] for c in COLUMNS})
+    pq.write_table(table, path, compression='zstd')
+
 def main():
     print("=" * 60)
     print("TimeOut London Cafes Scraper")
@@ -308,7 +467,7 @@ def main():
         print(f"✓ Page fetched successfully ({len(html)} bytes)")
     except Exception as e:
         print(f"✗ Could not fetch main page: {e}")
-        logging.error(f"Main fetch failed: {e}")
+        logging.error("Main fetch failed: %s", e)
         return
 
     print("\nExtracting cafe entries...")
@@ -320,58 +479,35 @@ def main():
         logging.warning("No entries extracted")
         return
 
-    rows = []
     print("Scraping individual cafe details:")
     print("-" * 60)
     
-    for idx, e in enumerate(entries, 1):
-        print(f"[{idx:2d}] {e['name'][:50]}")
-        
-        # Small delay to be polite
-        time.sleep(random.uniform(1.0, 2.0))
-
-        phone = ""
-        website = ""
-        address = e.get("address", "")
-
-        # Try to get more details from individual page
-        if e.get("source_link"):
-            try:
-                venue = scrape_venue_info(e["source_link"])
-                phone = venue.get("phone", "")
-                website = venue.get("website", "")
-                if not address:
-                    address = venue.get("address", "")
-            except Exception as ex:
-                logging.warning(f"Error scraping {e.get('source_link')}: {ex}")
-
-        row = {
-            "name": e.get("name", ""),
-            "description": e.get("description", ""),
-            "address": address,
-            "phone": phone,
-            "website": website,
-            "opening_hours": e.get("opening_hours", ""),
-            "source_link": e.get("source_link", "")
-        }
-        rows.append(row)
+    # Venue pages are independent, so overlap their fetches across workers;
+    # progress is printed here, in entry order, as the results come back
+    rows = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        for idx, row in enumerate(ex.map(enrich, entries), 1):
+            print(f"[{idx:2d}] {row['name'][:50]}")
+            rows.append(row)
 
     print("-" * 60)
     
-    # Create DataFrame
-    df = pd.DataFrame(rows)
-    
-    # Save files
+    # Save files in parallel; they are independent, so this costs about as long as the XLSX alone
     try:
-        df.to_csv(SAVE_CSV, index=False, encoding='utf-8')
-        df.to_excel(SAVE_XLSX, index=False, engine='openpyxl')
-        print(f"\n✓ Successfully saved {len(df)} cafes to:")
+        with ThreadPoolExecutor(max_workers=3) as ex:
+            futures = [ex.submit(write_parquet, rows, SAVE_PARQUET),
+                       ex.submit(write_csv, rows, SAVE_CSV),
+                       ex.submit(write_xlsx, rows, SAVE_XLSX)]
+            for f in futures:
+                f.result()
+        print(f"\n✓ Successfully saved {len(rows)} cafes to:")
+        print(f"  → {SAVE_PARQUET}")
         print(f"  → {SAVE_CSV}")
         print(f"  → {SAVE_XLSX}")
         print(f"\n✓ Logs saved to: {LOG_FILE}")
     except Exception as e:
         print(f"\n✗ Error saving files: {e}")
-        logging.error(f"Save error: {e}")
+        logging.error("Save error: %s", e)
 
     print("\n" + "=" * 60)
     print("Scraping complete!")